@@ -2,10 +2,21 @@
 import os
 import shutil
 import argparse
+import asyncio
+import functools
+import gzip
+import io
+import re
+import sqlite3
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import requests
-from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import FileResponse
+import aiofiles
+import httpx
+import orjson
+import xxhash
+from fastapi import FastAPI, Request
+from fastapi.responses import FileResponse, ORJSONResponse, Response
 import uvicorn
 import threading
 import json
@@ -15,6 +26,127 @@ import json
 # --------------------------
 
 
+class IgnorePatterns:
+    """Compiled form of a .syncignore file.
+
+    Patterns are bucketed by how cheaply they can be matched: literal
+    names (.git, node_modules, with or without a trailing "/" or "/**")
+    become a set checked per path component, pure extension globs like
+    *.pyc become an endswith() suffix tuple, literal multi-component
+    paths (build/output) go into a prefix trie walked one component at
+    a time, and only the remainder is folded into one combined regex.
+    match() tries the buckets cheapest first.
+    """
+
+    def __init__(self, patterns):
+        names = set()
+        suffixes = []
+        trie = {}
+        regex_patterns = []
+        for pat in patterns:
+            stripped = pat[:-3] if pat.endswith("/**") else pat.rstrip("/")
+            if "/" not in stripped and not _is_glob(stripped):
+                names.add(stripped)
+            elif stripped.startswith("*.") and "/" not in stripped and \
+                    not _is_glob(stripped[1:]):
+                suffixes.append(stripped[1:])
+            elif "/" in stripped and not _is_glob(stripped):
+                node = trie
+                for part in stripped.split("/"):
+                    node = node.setdefault(part, {})
+                node[_TRIE_END] = True
+            else:
+                regex_patterns.append(stripped)
+        self.names = frozenset(names)
+        self.suffixes = tuple(suffixes)
+        self.trie = trie or None
+        # Translate each remaining pattern once and fold them into a
+        # single alternation, so matching is one regex scan instead of
+        # a glob translation per pattern per file. The (?:^|/) prefix
+        # keeps the old Path.match behaviour of matching from a
+        # component boundary, and the (?:/.*)? suffix makes a matched
+        # directory cover everything beneath it.
+        if regex_patterns:
+            translated = ["(?:^|/)(?:%s)(?:/.*)?\\Z" % _glob_to_regex(p)
+                          for p in regex_patterns]
+            self.regex = re.compile("|".join(translated))
+        else:
+            self.regex = None
+
+    def match(self, rel_path):
+        # Normalise so patterns behave the same on Windows.
+        rel_path = str(rel_path).replace("\\", "/")
+        parts = rel_path.split("/")
+        if self.names:
+            # Any component hit covers both the entry itself and
+            # everything beneath it (peer listings may contain both).
+            for part in parts:
+                if part in self.names:
+                    return True
+        if self.suffixes and rel_path.endswith(self.suffixes):
+            return True
+        if self.trie is not None:
+            # Walk from every component offset so build/out matches
+            # x/build/out, keeping the same from-any-boundary anchoring
+            # as the regex bucket (and baseline Path.match). Hitting a
+            # terminal node ignores that prefix and its subtree.
+            for start in range(len(parts)):
+                node = self.trie
+                for part in parts[start:]:
+                    node = node.get(part)
+                    if node is None:
+                        break
+                    if _TRIE_END in node:
+                        return True
+        if self.regex is not None:
+            return self.regex.search(rel_path) is not None
+        return False
+
+
+# Sentinel marking "a pattern ends here" in the literal-path trie.
+_TRIE_END = object()
+
+
+def _is_glob(pat):
+    return any(c in pat for c in "*?[")
+
+
+def _glob_to_regex(pat):
+    """Like fnmatch.translate, but * stays within one path component
+    (matching Path.match) and ** crosses components."""
+    i, n, out = 0, len(pat), []
+    while i < n:
+        c = pat[i]
+        i += 1
+        if c == "*":
+            if i < n and pat[i] == "*":
+                i += 1
+                out.append(".*")
+            else:
+                out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = i
+            if j < n and pat[j] == "!":
+                j += 1
+            if j < n and pat[j] == "]":
+                j += 1
+            while j < n and pat[j] != "]":
+                j += 1
+            if j >= n:
+                out.append("\\[")
+            else:
+                stuff = pat[i:j]
+                if stuff.startswith("!"):
+                    stuff = "^" + stuff[1:]
+                out.append("[%s]" % stuff)
+                i = j + 1
+        else:
+            out.append(re.escape(c))
+    return "".join(out)
+
+
 def load_files_to_ignore(ignore_file):
     patterns = []
     if ignore_file.exists():
@@ -23,117 +155,653 @@ def load_files_to_ignore(ignore_file):
                 line = line.strip()
                 if line and not line.startswith("#"):
                     patterns.append(line)
-    return patterns
+    return IgnorePatterns(patterns)
 
 
+# The same relative paths get matched repeatedly (local walk, then the
+# merged local/peer loop), so memoise per (path, matcher) pair. The
+# matcher is keyed by identity, so a fresh IgnorePatterns per run never
+# sees stale entries.
+@functools.lru_cache(maxsize=65536)
 def should_ignore(rel_path, ignore_patterns):
-    for pat in ignore_patterns:
-        if Path(rel_path).match(pat):
-            return True
-    return False
+    return ignore_patterns.match(rel_path)
 
 # --------------------------
 # Local file listing
 # --------------------------
 
 
-def get_file_list(folder, ignore_patterns):
-    folder = Path(folder).resolve()
-    file_list = {}
-    for root, dirs, files in os.walk(folder):
-        rel_root = Path(root).relative_to(folder)
-
-        for d in dirs:
-            rel_path = rel_root / d
+def _scan_tree(folder, rel_prefix, ignore_patterns, file_list,
+               dir_cache=None, dir_mtime_ns=None, pending_dirs=None):
+    # Fast path: if this directory's mtime matches the cached value,
+    # serve its children straight from sqlite without touching disk.
+    # Note a dir mtime only moves on create/delete/rename, not on
+    # in-place writes, which is why callers must opt in (--fast-list).
+    if dir_cache is not None and dir_mtime_ns is not None:
+        cached = dir_cache.get_dir_listing(folder, dir_mtime_ns)
+        if cached is not None:
+            for name, meta in cached.items():
+                rel_path = rel_prefix + name
+                if should_ignore(rel_path, ignore_patterns):
+                    continue
+                file_list[rel_path] = meta
+                if meta.get("is_dir"):
+                    sub = os.path.join(folder, name)
+                    try:
+                        sub_mtime_ns = os.stat(sub).st_mtime_ns
+                    except OSError:
+                        continue
+                    _scan_tree(sub, rel_path + "/", ignore_patterns,
+                               file_list, dir_cache, sub_mtime_ns,
+                               pending_dirs)
+            return file_list
+
+    listing = {}
+    try:
+        entries = os.scandir(folder)
+    except OSError:
+        # Unreadable directory: skip it like os.walk's default, rather
+        # than failing the whole listing.
+        return file_list
+    with entries:
+        for entry in entries:
+            # Build the relative path from a running prefix instead of
+            # recomputing relative_to() per file.
+            rel_path = rel_prefix + entry.name
+            try:
+                is_dir = entry.is_dir(follow_symlinks=False)
+                if is_dir:
+                    meta = {"is_dir": True}
+                    sub_mtime_ns = (
+                        entry.stat(follow_symlinks=False).st_mtime_ns
+                        if dir_cache is not None else None)
+                else:
+                    # DirEntry.stat() reuses the stat from the
+                    # directory read, avoiding a second syscall per
+                    # file.
+                    stat = entry.stat()
+                    meta = {
+                        "size": stat.st_size,
+                        "mtime": int(stat.st_mtime)
+                    }
+            except OSError:
+                # Entry vanished mid-walk or is unreadable; skip it.
+                continue
+            # Ignored entries are cached too, so the cache stays
+            # valid if the ignore file changes.
+            listing[entry.name] = meta
             if should_ignore(rel_path, ignore_patterns):
                 continue
-            file_list[str(rel_path)] = {"is_dir": True}
+            file_list[rel_path] = meta
+            if is_dir:
+                _scan_tree(entry.path, rel_path + "/", ignore_patterns,
+                           file_list, dir_cache, sub_mtime_ns,
+                           pending_dirs)
+    if pending_dirs is not None and dir_mtime_ns is not None:
+        pending_dirs.append((folder, dir_mtime_ns, listing))
+    return file_list
 
-        for file in files:
-            rel_path = rel_root / file
-            if should_ignore(rel_path, ignore_patterns):
+
+def _scan_subtree(folder, rel_prefix, ignore_patterns,
+                  dir_cache, dir_mtime_ns):
+    file_list = {}
+    pending_dirs = [] if dir_cache is not None else None
+    _scan_tree(folder, rel_prefix, ignore_patterns, file_list,
+               dir_cache, dir_mtime_ns, pending_dirs)
+    if dir_cache is not None:
+        # Batched in one transaction per subtree instead of one write
+        # per directory.
+        dir_cache.put_dir_listings(pending_dirs)
+    return file_list
+
+
+WALK_THREADS = 16
+
+
+def get_file_list(folder, ignore_patterns, state_cache=None,
+                  trust_dir_mtimes=False):
+    folder = Path(folder).resolve()
+    dir_cache = state_cache if trust_dir_mtimes else None
+    file_list = {}
+    subdirs = []
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if should_ignore(entry.name, ignore_patterns):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    file_list[entry.name] = {"is_dir": True}
+                    subdirs.append(
+                        (entry.path, entry.name,
+                         entry.stat(follow_symlinks=False).st_mtime_ns
+                         if dir_cache is not None else None))
+                else:
+                    stat = entry.stat()
+                    file_list[entry.name] = {
+                        "size": stat.st_size,
+                        "mtime": int(stat.st_mtime)
+                    }
+            except OSError:
                 continue
-            fpath = folder / rel_path
-            stat = fpath.stat()
-            file_list[str(rel_path)] = {
-                "size": stat.st_size,
-                "mtime": int(stat.st_mtime)
-            }
+
+    # Walk top-level subtrees in parallel: stat releases the GIL, so
+    # threads overlap the syscall latency that dominates on slow or
+    # networked filesystems.
+    if subdirs:
+        with ThreadPoolExecutor(
+                max_workers=min(WALK_THREADS, len(subdirs))) as pool:
+            futures = [
+                pool.submit(_scan_subtree, path, name + "/",
+                            ignore_patterns, dir_cache, mtime_ns)
+                for path, name, mtime_ns in subdirs
+            ]
+            for future in futures:
+                file_list.update(future.result())
     return file_list
 
+# --------------------------
+# State cache (sqlite)
+# --------------------------
+
+
+class StateCache:
+    """Persistent (path, size, mtime) -> xxh3 cache in ~/.syncer.
+
+    Hashing is only redone for files whose size or mtime changed, so
+    a warm re-sync never re-reads unchanged content.
+    """
+
+    def __init__(self, db_path=None):
+        if db_path is None:
+            db_path = Path.home() / ".syncer" / "state.db"
+        db_path = Path(db_path)
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self.lock = threading.Lock()
+        with self.conn:
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, size INT, mtime INT, xxh3 TEXT)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS dirs ("
+                "path TEXT PRIMARY KEY, mtime_ns INT, listing TEXT)")
+
+    def get_hash(self, path, size, mtime):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT xxh3 FROM files "
+                "WHERE path = ? AND size = ? AND mtime = ?",
+                (path, size, mtime)).fetchone()
+        return row[0] if row else None
+
+    def put_hashes(self, rows):
+        if not rows:
+            return
+        # One transaction for the whole batch to amortise fsyncs.
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", rows)
+
+    def get_dir_listing(self, path, mtime_ns):
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT listing FROM dirs "
+                "WHERE path = ? AND mtime_ns = ?",
+                (path, mtime_ns)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_dir_listings(self, rows):
+        if not rows:
+            return
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)",
+                [(path, mtime_ns, json.dumps(listing))
+                 for path, mtime_ns, listing in rows])
+
+
+def hash_file(fpath):
+    h = xxhash.xxh3_64()
+    with open(fpath, "rb") as f:
+        while chunk := f.read(1 << 20):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def hash_for_paths(folder, paths, state_cache):
+    """xxh3 digests for the given relative paths, via the cache.
+
+    Called lazily with only the paths whose size/mtime disagree across
+    sides, so a listing never has to read the whole tree.
+    """
+    # Plain string joins: building a Path per file costs several
+    # allocations each in what is a per-file loop.
+    folder = str(folder)
+    result = {}
+    updates = []
+    for rel_path in paths:
+        abs_path = os.path.join(folder, rel_path)
+        try:
+            st = os.stat(abs_path)
+        except OSError:
+            continue
+        size, mtime = st.st_size, int(st.st_mtime)
+        digest = state_cache.get_hash(abs_path, size, mtime)
+        if digest is None:
+            digest = hash_file(abs_path)
+            updates.append((abs_path, size, mtime, digest))
+        result[rel_path] = digest
+    state_cache.put_hashes(updates)
+    return result
+
+
+# --------------------------
+# Batch transfers (tar)
+# --------------------------
+
+# Files below this size are shipped many-per-request inside a tar
+# stream; anything larger goes through the single-file endpoints.
+BATCH_BYTES_LIMIT = 64 << 20
+
+
+def build_tar(folder, paths):
+    folder = str(folder)
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode="w") as tar:
+        for path in paths:
+            tar.add(os.path.join(folder, path), arcname=path,
+                    recursive=False)
+    buf.seek(0)
+    return buf
+
+
+def extract_tar(fileobj, folder):
+    with tarfile.open(fileobj=fileobj, mode="r") as tar:
+        # "data" filter refuses absolute paths / parent escapes
+        tar.extractall(folder, filter="data")
+
+
+def group_batches(sized_paths):
+    """Greedily pack (path, size) pairs into ≤BATCH_BYTES_LIMIT groups."""
+    batches, current, current_size = [], [], 0
+    for path, size in sized_paths:
+        if current and current_size + size > BATCH_BYTES_LIMIT:
+            batches.append(current)
+            current, current_size = [], 0
+        current.append(path)
+        current_size += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+# --------------------------
+# Delta transfers (block diffs)
+# --------------------------
+
+# Large files that changed on one side are reconciled rsync-style:
+# exchange per-block xxh3 signatures, then ship only the blocks that
+# differ. Blocks are fixed-offset (no rolling hash), which still wins
+# big for append- or edit-in-place workloads like logs and databases.
+DELTA_BLOCK_SIZE = 4 << 20
+
+
+def block_signature(fpath):
+    sig = []
+    with open(fpath, "rb") as f:
+        while block := f.read(DELTA_BLOCK_SIZE):
+            sig.append(xxhash.xxh3_64(block).hexdigest())
+    return sig
+
+
+def build_delta(fpath, peer_sig):
+    """Frames of (offset, length, data) for blocks the peer lacks."""
+    frames = []
+    with open(fpath, "rb") as f:
+        index = 0
+        while block := f.read(DELTA_BLOCK_SIZE):
+            if index >= len(peer_sig) or \
+                    xxhash.xxh3_64(block).hexdigest() != peer_sig[index]:
+                frames.append(
+                    (index * DELTA_BLOCK_SIZE).to_bytes(8, "big")
+                    + len(block).to_bytes(4, "big") + block)
+            index += 1
+    return b"".join(frames)
+
+
+def apply_delta(fpath, delta, size):
+    fpath = Path(fpath)
+    fpath.parent.mkdir(parents=True, exist_ok=True)
+    mode = "r+b" if fpath.exists() else "wb"
+    with open(fpath, mode) as f:
+        i = 0
+        while i < len(delta):
+            offset = int.from_bytes(delta[i:i + 8], "big")
+            length = int.from_bytes(delta[i + 8:i + 12], "big")
+            f.seek(offset)
+            f.write(delta[i + 12:i + 12 + length])
+            i += 12 + length
+        f.truncate(size)
+
+
 # --------------------------
 # Server (FastAPI)
 # --------------------------
 
 
-def start_server(folder, port):
+def _gzip_json(payload, request):
+    """JSON response, gzipped only when the client accepts it and the
+    body is big enough to be worth the CPU."""
+    headers = {}
+    if len(payload) >= 1024 and "gzip" in \
+            request.headers.get("accept-encoding", "").lower():
+        payload = gzip.compress(payload)
+        headers["content-encoding"] = "gzip"
+    return Response(content=payload, media_type="application/json",
+                    headers=headers)
+
+
+def start_server(folder, port, fast_list=False):
     app = FastAPI()
     folder = Path(folder).resolve()
     ignore_patterns = load_files_to_ignore(folder / ".syncignore")
+    state_cache = StateCache()
 
     @app.get("/list")
-    def list_files():
-        return get_file_list(folder, ignore_patterns)
+    def list_files(request: Request):
+        # orjson serialises the listing several times faster than the
+        # stdlib encoder, which matters once trees hit tens of
+        # thousands of paths. Long listings are mostly repeated path
+        # prefixes and gzip 3-10x; file bodies stay uncompressed so
+        # /get keeps its sendfile path and already-compressed media
+        # isn't re-squeezed.
+        listing = get_file_list(folder, ignore_patterns, state_cache,
+                                trust_dir_mtimes=fast_list)
+        return _gzip_json(orjson.dumps(listing), request)
+
+    @app.post("/hashes")
+    async def hashes(paths: list[str], request: Request):
+        # Second pass of the lazy hash protocol: the client sends only
+        # the paths whose size/mtime conflict with its own listing.
+        result = await asyncio.to_thread(
+            hash_for_paths, folder, paths, state_cache)
+        return _gzip_json(orjson.dumps(result), request)
 
     @app.get("/get/{file_path:path}")
-    def get_file(file_path: str):
+    async def get_file(file_path: str):
         f = folder / file_path
         if f.exists():
             return FileResponse(f)
         return {"error": "file not found"}
 
     @app.post("/put/{file_path:path}")
-    async def put_file(file_path: str, file: UploadFile = File(...)):
+    async def put_file(file_path: str, request: Request):
         fpath = folder / file_path
         fpath.parent.mkdir(parents=True, exist_ok=True)
-        with open(fpath, "wb") as out_f:
-            out_f.write(await file.read())
+        # Raw body, streamed chunk by chunk: no multipart framing to
+        # parse and never more than one chunk of the upload in RAM.
+        async with aiofiles.open(fpath, "wb") as out_f:
+            async for chunk in request.stream():
+                await out_f.write(chunk)
         return {"status": "ok"}
 
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    @app.get("/signature/{file_path:path}")
+    async def signature(file_path: str):
+        f = folder / file_path
+        if not f.exists():
+            return {"error": "file not found"}
+        sig = await asyncio.to_thread(block_signature, f)
+        return ORJSONResponse(sig)
 
+    @app.post("/delta/{file_path:path}")
+    async def delta(file_path: str, request: Request):
+        f = folder / file_path
+        peer_sig = orjson.loads(await request.body())
+        delta_bytes = await asyncio.to_thread(build_delta, f, peer_sig)
+        return Response(content=delta_bytes,
+                        media_type="application/octet-stream",
+                        headers={"x-file-size": str(f.stat().st_size)})
+
+    @app.post("/patch/{file_path:path}")
+    async def patch_file(file_path: str, size: int, request: Request):
+        body = await request.body()
+        await asyncio.to_thread(apply_delta, folder / file_path, body, size)
+        return {"status": "ok"}
 
-# --------------------------
-# Client sync logic
-# --------------------------
-def sync_with_peer(folder, peer_url, ignore_patterns, dry_run=False,
-                   log=False):
-    folder = Path(folder).resolve()
-    local_files = get_file_list(folder, ignore_patterns)
+    @app.post("/batch-get")
+    async def batch_get(paths: list[str]):
+        buf = await asyncio.to_thread(build_tar, folder, paths)
+        return Response(content=buf.getvalue(),
+                        media_type="application/x-tar")
+
+    @app.post("/batch-put")
+    async def batch_put(request: Request):
+        body = await request.body()
+        await asyncio.to_thread(extract_tar, io.BytesIO(body), folder)
+        return {"status": "ok"}
 
     try:
-        r = requests.get(f"{peer_url}/list", timeout=10)
-        peer_files = r.json()
-    except Exception as e:
-        print(f"[ERROR] Cannot connect to peer {peer_url}: {e}")
-        return
+        import uvloop  # noqa: F401
+        loop_impl = "uvloop"
+    except ImportError:  # no uvloop build on Windows
+        loop_impl = "asyncio"
+    uvicorn.run(app, host="0.0.0.0", port=port,
+                loop=loop_impl, http="httptools")
 
-    all_paths = set(local_files.keys()).union(set(peer_files.keys()))
 
-    for path in all_paths:
-        if should_ignore(path, ignore_patterns):
+# --------------------------
+# Local sync logic
+# --------------------------
+def _fast_copy(src, dst):
+    """copy2 minus the 64KB userspace loop: sendfile moves the bytes
+    entirely in-kernel where available, with a large-buffer fallback."""
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            if not hasattr(os, "sendfile"):
+                raise OSError
+            # A single sendfile call is capped (0x7ffff000 bytes on
+            # Linux) and may return short, so loop on the byte count
+            # or large files get silently truncated.
+            offset = 0
+            remaining = os.fstat(s.fileno()).st_size
+            while remaining > 0:
+                sent = os.sendfile(d.fileno(), s.fileno(), offset,
+                                   remaining)
+                if sent == 0:
+                    break
+                offset += sent
+                remaining -= sent
+        except OSError:
+            s.seek(0)
+            d.seek(0)
+            d.truncate()
+            shutil.copyfileobj(s, d, length=1 << 24)
+    # Preserve mtimes so the next sync sees both sides equal.
+    shutil.copystat(src, dst)
+
+
+def sync_dirs(src, dst, ignore_patterns, dry_run=False, log=False,
+              fast_list=False):
+    src = Path(src).resolve()
+    dst = Path(dst).resolve()
+
+    # List both sides once and diff the dicts instead of stat'ing the
+    # destination per file.
+    state_cache = StateCache()
+    src_list = get_file_list(src, ignore_patterns, state_cache,
+                             trust_dir_mtimes=fast_list)
+    dst_list = get_file_list(dst, ignore_patterns, state_cache,
+                             trust_dir_mtimes=fast_list)
+
+    # Lazy hashing for mtime false-positives, as in sync_with_peer.
+    conflicts = [
+        path for path in set(src_list) & set(dst_list)
+        if not src_list[path].get("is_dir")
+        and not dst_list[path].get("is_dir")
+        and src_list[path]["mtime"] != dst_list[path]["mtime"]
+        and src_list[path]["size"] == dst_list[path]["size"]
+    ]
+    if conflicts:
+        for file_list, base in ((src_list, src), (dst_list, dst)):
+            for path, digest in hash_for_paths(
+                    base, conflicts, state_cache).items():
+                file_list[path]["xxh3"] = digest
+
+    for path in set(src_list) | set(dst_list):
+        action = determine_action(src_list.get(path), dst_list.get(path))
+        if not action:
             continue
 
-        local_meta = local_files.get(path)
-        peer_meta = peer_files.get(path)
+        if action in ("upload", "upload_new"):
+            from_path, to_path = src / path, dst / path
+        else:
+            from_path, to_path = dst / path, src / path
 
-        action = determine_action(local_meta, peer_meta)
-        if not action:
+        if log or dry_run:
+            print(f"[{action.upper()}] {path}")
+        if dry_run:
             continue
 
-        local_path = folder / path
+        if from_path.is_dir():
+            to_path.mkdir(parents=True, exist_ok=True)
+        else:
+            to_path.parent.mkdir(parents=True, exist_ok=True)
+            _fast_copy(from_path, to_path)
 
-        if action in ("download", "download_new"):
-            if log or dry_run:
-                print(f"[{action.upper()}] {path}")
-            if not dry_run:
-                download_file(peer_url, path, local_path)
 
-        elif action in ("upload", "upload_new"):
+# --------------------------
+# Client sync logic
+# --------------------------
+MAX_INFLIGHT_TRANSFERS = 32
+
+
+async def sync_with_peer(folder, peer_url, ignore_patterns, dry_run=False,
+                         log=False, fast_list=False):
+    folder = Path(folder).resolve()
+    state_cache = StateCache()
+    local_files = get_file_list(folder, ignore_patterns, state_cache,
+                                trust_dir_mtimes=fast_list)
+
+    # Keep connections alive across transfers; a fresh TCP handshake
+    # per small file would dominate the transfer time. http2=True lets
+    # the in-flight transfers multiplex onto one connection when the
+    # peer is reached over TLS with h2 (e.g. behind a reverse proxy);
+    # plain-HTTP peers keep using pooled HTTP/1.1 connections.
+    limits = httpx.Limits(max_connections=64, max_keepalive_connections=32)
+    async with httpx.AsyncClient(base_url=peer_url, limits=limits,
+                                 http2=True, timeout=30) as client:
+        try:
+            r = await client.get("/list", timeout=10)
+            peer_files = orjson.loads(r.content)
+        except Exception as e:
+            print(f"[ERROR] Cannot connect to peer {peer_url}: {e}")
+            return
+
+        all_paths = set(local_files.keys()).union(set(peer_files.keys()))
+
+        # Lazy hashing: only files whose mtimes disagree while sizes
+        # match can be mtime false-positives, so only those get read —
+        # locally and via /hashes on the peer.
+        conflicts = []
+        for path in all_paths:
+            local_meta = local_files.get(path)
+            peer_meta = peer_files.get(path)
+            if (local_meta and peer_meta
+                    and not local_meta.get("is_dir")
+                    and not peer_meta.get("is_dir")
+                    and local_meta["mtime"] != peer_meta["mtime"]
+                    and local_meta["size"] == peer_meta["size"]
+                    and not should_ignore(path, ignore_patterns)):
+                conflicts.append(path)
+        if conflicts:
+            local_hashes = await asyncio.to_thread(
+                hash_for_paths, folder, conflicts, state_cache)
+            try:
+                r = await client.post("/hashes", json=conflicts)
+                r.raise_for_status()
+                peer_hashes = orjson.loads(r.content)
+            except Exception:
+                # Older peer without /hashes: mtimes decide, as before.
+                peer_hashes = {}
+            for path, digest in local_hashes.items():
+                local_files[path]["xxh3"] = digest
+            for path, digest in peer_hashes.items():
+                peer_files[path]["xxh3"] = digest
+
+        downloads, uploads = [], []
+        for path in all_paths:
+            if should_ignore(path, ignore_patterns):
+                continue
+
+            local_meta = local_files.get(path)
+            peer_meta = peer_files.get(path)
+
+            action = determine_action(local_meta, peer_meta)
+            if not action:
+                continue
+
             if log or dry_run:
                 print(f"[{action.upper()}] {path}")
-            if not dry_run:
-                upload_file(peer_url, path, local_path)
+            if dry_run:
+                continue
+
+            local_path = folder / path
+            is_dir = (local_meta or peer_meta).get("is_dir")
+
+            if action in ("download", "download_new"):
+                if is_dir:
+                    local_path.mkdir(parents=True, exist_ok=True)
+                else:
+                    downloads.append((path, peer_meta.get("size", 0),
+                                      action))
+            elif action in ("upload", "upload_new"):
+                # Directories ride along in the tar batches: a dir
+                # member (size 0) creates it on extract, which is the
+                # only way an *empty* dir ever reaches the peer — /put
+                # only creates parents of files.
+                uploads.append((path, local_meta.get("size", 0),
+                                action))
+
+        # Small files ride together in tar batches — one request per
+        # ~64 MB instead of one per file. Big files that exist on both
+        # sides go block-delta; the rest stream individually.
+        transfers = []
+        for paths in group_batches(
+                [(p, s) for p, s, a in downloads if s < BATCH_BYTES_LIMIT]):
+            transfers.append(batch_download(client, folder, paths))
+        for path, size, action in downloads:
+            if size >= BATCH_BYTES_LIMIT:
+                if action == "download":
+                    transfers.append(
+                        delta_download(client, path, folder / path))
+                else:
+                    transfers.append(
+                        download_file(client, path, folder / path))
+        for paths in group_batches(
+                [(p, s) for p, s, a in uploads if s < BATCH_BYTES_LIMIT]):
+            transfers.append(batch_upload(client, folder, paths))
+        for path, size, action in uploads:
+            if size >= BATCH_BYTES_LIMIT:
+                if action == "upload":
+                    transfers.append(
+                        delta_upload(client, path, folder / path))
+                else:
+                    transfers.append(
+                        upload_file(client, path, folder / path))
+
+        # Run transfers concurrently so small files no longer pay one
+        # full round trip each, capped so we don't flood the peer.
+        sem = asyncio.Semaphore(MAX_INFLIGHT_TRANSFERS)
+
+        async def bounded(coro):
+            async with sem:
+                await coro
+
+        results = await asyncio.gather(
+            *(bounded(t) for t in transfers), return_exceptions=True)
+        for err in results:
+            if isinstance(err, Exception):
+                print(f"[ERROR] Transfer failed: {err}")
 
 
 def determine_action(local_meta, peer_meta):
@@ -153,6 +821,12 @@ def determine_action(local_meta, peer_meta):
             return None  # Both exist → skip
     # File logic
     if local_meta and peer_meta:
+        # Identical content beats a differing mtime: filesystems that
+        # round timestamps (FAT32, SMB) would otherwise force copies
+        # of unchanged files.
+        local_hash = local_meta.get("xxh3")
+        if local_hash and local_hash == peer_meta.get("xxh3"):
+            return None
         if peer_meta["mtime"] > local_meta["mtime"]:
             return "download"
         elif local_meta["mtime"] > peer_meta["mtime"]:
@@ -167,19 +841,66 @@ def determine_action(local_meta, peer_meta):
         return None
 
 
-def download_file(peer_url, path, local_path):
-    url = f"{peer_url}/get/{path}"
-    r = requests.get(url)
+async def download_file(client, path, local_path):
     local_path.parent.mkdir(parents=True, exist_ok=True)
-    with open(local_path, "wb") as f:
-        f.write(r.content)
+    # Stream to disk in chunks so large downloads stay out of RAM.
+    async with client.stream("GET", f"/get/{path}") as r:
+        r.raise_for_status()
+        async with aiofiles.open(local_path, "wb") as f:
+            async for chunk in r.aiter_bytes(1 << 20):
+                await f.write(chunk)
+
+
+async def upload_file(client, path, local_path):
+    async def file_chunks():
+        async with aiofiles.open(local_path, "rb") as f:
+            while chunk := await f.read(1 << 20):
+                yield chunk
+
+    # Chunked transfer of the raw body; httpx never materialises the
+    # file, so memory stays constant however large the upload is.
+    r = await client.post(f"/put/{path}", content=file_chunks())
+    r.raise_for_status()
+
+
+async def delta_download(client, path, local_path):
+    sig = await asyncio.to_thread(block_signature, local_path)
+    r = await client.post(f"/delta/{path}", content=orjson.dumps(sig))
+    r.raise_for_status()
+    size = int(r.headers["x-file-size"])
+    await asyncio.to_thread(apply_delta, local_path, r.content, size)
+
+
+async def delta_upload(client, path, local_path):
+    r = await client.get(f"/signature/{path}")
+    r.raise_for_status()
+    peer_sig = orjson.loads(r.content)
+    if not isinstance(peer_sig, list):
+        # Peer lost the file since we listed; send the whole thing.
+        await upload_file(client, path, local_path)
+        return
+    delta = await asyncio.to_thread(build_delta, local_path, peer_sig)
+    size = os.path.getsize(local_path)
+    if len(delta) >= size:
+        # Nothing shared with the peer copy; a plain upload is cheaper
+        # than a delta that carries every block plus framing.
+        await upload_file(client, path, local_path)
+        return
+    r = await client.post(f"/patch/{path}", params={"size": size},
+                          content=delta)
+    r.raise_for_status()
+
 
+async def batch_download(client, folder, paths):
+    r = await client.post("/batch-get", json=paths)
+    r.raise_for_status()
+    await asyncio.to_thread(extract_tar, io.BytesIO(r.content), folder)
 
-def upload_file(peer_url, path, local_path):
-    url = f"{peer_url}/put/{path}"
-    with open(local_path, "rb") as f:
-        files = {"file": (path, f)}
-        requests.post(url, files=files)
+
+async def batch_upload(client, folder, paths):
+    buf = await asyncio.to_thread(build_tar, folder, paths)
+    r = await client.post("/batch-put", content=buf.getvalue())
+    r.raise_for_status()
 
 
 # --------------------------
@@ -194,10 +915,16 @@ def main():
                         help="Preview actions without transferring")
     parser.add_argument("--ignore", default=".syncignore",
                         help="Ignore file in project")
+    parser.add_argument("--fast-list", action="store_true",
+                        help="Trust cached directory listings when the "
+                             "directory mtime is unchanged (misses "
+                             "in-place edits to existing files)")
     parser.add_argument("--server", action="store_true",
                         help="Run as server only")
     parser.add_argument(
         "--client", help="Run as client and connect to this peer URL")
+    parser.add_argument(
+        "--local", help="Sync with this local folder instead of a peer")
     parser.add_argument("--port", type=int, default=8000,
                         help="Server port (default 8000)")
     args = parser.parse_args()
@@ -206,11 +933,16 @@ def main():
     ignore_patterns = load_files_to_ignore(folder / args.ignore)
 
     if args.server:
-        start_server(folder, args.port)
+        start_server(folder, args.port, fast_list=args.fast_list)
     elif args.client:
         # Manual client mode
-        sync_with_peer(folder, args.client, ignore_patterns,
-                       dry_run=args.dry_run, log=args.log)
+        asyncio.run(sync_with_peer(folder, args.client, ignore_patterns,
+                                   dry_run=args.dry_run, log=args.log,
+                                   fast_list=args.fast_list))
+    elif args.local:
+        sync_dirs(folder, args.local, ignore_patterns,
+                  dry_run=args.dry_run, log=args.log,
+                  fast_list=args.fast_list)
     else:
         # Auto mode (placeholder for LAN discovery)
         print(